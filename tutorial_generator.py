@@ -1,16 +1,41 @@
+from __future__ import annotations
+
 import argparse
-import datetime
-import glob
+import ast
+import hashlib
+import inspect
 import json
+import os
+import pickle
+import queue
+import re
 import shutil
+import struct
 import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import warnings
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from enum import Enum
-from pathlib import Path
+from itertools import count
+from types import MappingProxyType
+from typing import TYPE_CHECKING
 import wave
 
-from moviepy.editor import *
-from playwright.sync_api import Playwright, sync_playwright, Page, Locator
-from TTS.api import TTS
+# Heavy modules are imported where they are needed, so that e.g. --help prints immediately
+if TYPE_CHECKING:
+    from piper import PiperVoice
+    from playwright.sync_api import Playwright, Page, Locator
+    from TTS.api import TTS
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 
 class VoiceEngine(Enum):
@@ -21,15 +46,61 @@ class VoiceEngine(Enum):
     PIPER = "piper"
 
 
-tmp_dir_path = './tmp'
-voice_engine = VoiceEngine.COQUI.value
-coqui_tts: TTS | None = None
-piper_path = './piper/piper'
-translations = {}
-tts_model = ''
+# Synthesized voices are kept here between runs
+DEFAULT_VOICE_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'tutorial-generator')
+
+# Silence after each sentence, the default of the piper executable
+PIPER_SENTENCE_SILENCE_SEC = 0.2
 
-# Used to recognize if a voice is currently active
-last_voice_end_timestamp: float = 0.0
+
+# Input and output arguments of the hardware H.264 encoders in the order they are tried
+HARDWARE_VIDEO_ENCODERS = {
+    'h264_nvenc': ([], ['-c:v', 'h264_nvenc', '-preset', 'p4', '-tune', 'hq', '-rc', 'vbr', '-cq', '23', '-b:v', '0',
+                        '-pix_fmt', 'yuv420p']),
+    'h264_vaapi': (['-vaapi_device', '/dev/dri/renderD128'],
+                   ['-vf', 'format=nv12,hwupload', '-c:v', 'h264_vaapi', '-qp', '23']),
+    'h264_videotoolbox': ([], ['-c:v', 'h264_videotoolbox', '-b:v', '5M', '-pix_fmt', 'yuv420p']),
+}
+
+
+@dataclass(frozen=True)
+class VoiceConfig:
+    """
+    Settings of the voice synthesis. They are passed explicitly to the synthesis workers.
+    """
+    engine: str = VoiceEngine.COQUI.value
+    model: str = ''
+    piper_path: str = './piper/piper'
+    # Use the piper executable even if the piper python package is installed
+    piper_subprocess: bool = False
+    # Quantize the linear layers of the coqui model to int8 on cpu
+    quantize: bool = False
+    use_cache: bool = True
+    cache_dir: str = DEFAULT_VOICE_CACHE_DIR
+
+
+class VoiceModel:
+    """
+    A loaded voice model. It is created by init_voice and stopped by close_voice.
+    """
+
+    def __init__(self):
+        self.coqui_tts: TTS | None = None
+        self.coqui_device = 'cpu'
+        # The coqui TTS object is not thread-safe, so its calls are serialized
+        self.coqui_lock = threading.Lock()
+        # Piper runs in this process if the piper python package is installed
+        self.piper_voice: PiperVoice | None = None
+        # Otherwise, each tts worker gets a piper process which it reuses for all its voices,
+        # so that the model is only loaded once per process
+        self.piper_processes: list[subprocess.Popen] = []
+        # Piper processes which are not synthesizing a voice at the moment
+        self.idle_piper_processes: queue.SimpleQueue[subprocess.Popen] = queue.SimpleQueue()
+        # The espeak phonemizer of piper handles one text after another
+        self.piper_lock = threading.Lock()
+
+
+translations = {}
 
 EXAMPLE_HELP_SECTION = '''
 Examples:
@@ -47,10 +118,20 @@ Examples:
 
 def _get_audio_duration(audio_file: str) -> float:
     """
-    Gets the audio duration in milliseconds
+    Gets the audio duration in milliseconds.
+    Only the canonical 44 byte PCM header is read. Other headers are parsed by the wave module.
     :param audio_file: path to wav audio file
     :return: duration in ms
     """
+    with open(audio_file, 'rb') as f:
+        header = f.read(44)
+
+    if len(header) == 44 and header[:4] == b'RIFF' and header[8:16] == b'WAVEfmt ' \
+            and struct.unpack_from('<I', header, 16)[0] == 16 and header[36:40] == b'data':
+        channels, sample_rate = struct.unpack_from('<HI', header, 22)
+        bits_per_sample, data_size = struct.unpack_from('<HxxxxI', header, 34)
+        return data_size / (sample_rate * channels * bits_per_sample / 8) * 1000
+
     with wave.open(audio_file, 'rb') as f:
         return (f.getnframes() / float(f.getframerate())) * 1000
 
@@ -61,64 +142,341 @@ def _get_translation(key: str) -> str:
     :param key: translation key
     :return: translation if key exists. Otherwise, passed key.
     """
-    global translations
+    return translations.get(key, key)
 
-    if key not in translations:
-        return key
 
-    return translations[key]
+def _voice_cache_path(config: VoiceConfig, text: str) -> str:
+    """
+    Gets the cache path of a voice. The path is addressed by the engine, the model and the text.
+    :param config: voice settings
+    :param text: text to be voiced
+    :return: path of the cached wav file
+    """
+    model_slug = re.sub(r'[^\w.-]+', '_', config.model).strip('._')
+    # Quantized models sound slightly different, so their voices are cached separately
+    model_key = f'{config.model}|int8' if config.quantize else config.model
+    text_hash = hashlib.sha256(f'{config.engine}|{model_key}|{text}'.encode()).hexdigest()
+    return os.path.join(config.cache_dir, config.engine, model_slug, f'{text_hash}.wav')
 
 
-def generate_voice(self, text: str, wait=True):
+def _run_voice_engine(config: VoiceConfig, voice_model: VoiceModel, text: str, output_file: str) -> float:
+    """
+    Synthesizes the text with the selected voice engine
+    :param config: voice settings
+    :param voice_model: loaded voice model
+    :param text: text to be voiced
+    :param output_file: path of the wav file to be written
+    :return: duration of the voice in ms
+    :raises CalledProcessError: If piper has exited
+    :raises RuntimeError: If the voice model is closed
     """
-    Generates voice that will be played in the video at the time of the call.
-    If a voice is active when this function is called, the new voice will be added after its end.
+    if config.engine == VoiceEngine.COQUI.value:
+        coqui_tts = voice_model.coqui_tts
+        import numpy as np
+        import torch
+
+        # On CUDA the model runs in half precision. The text is a single sentence already.
+        with voice_model.coqui_lock, torch.inference_mode(), \
+                torch.autocast('cuda', dtype=torch.float16, enabled=voice_model.coqui_device == 'cuda'):
+            wav = np.asarray(coqui_tts.tts(text=text, split_sentences=False), dtype=np.float32)
+
+        # Normalize like coqui's wav writer, but take the duration from the samples
+        samples = (wav * (32767 / max(0.01, np.max(np.abs(wav))))).astype(np.int16)
+        sample_rate = coqui_tts.synthesizer.output_sample_rate
+        with wave.open(output_file, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes(samples.tobytes())
+
+        return len(samples) / sample_rate * 1000
+    elif voice_model.piper_voice is not None:
+        piper_voice = voice_model.piper_voice
+        with voice_model.piper_lock:
+            sentence_phonemes = piper_voice.phonemize(text)
+
+        # The onnx session can be run by several threads at once
+        silence = bytes(int(PIPER_SENTENCE_SILENCE_SEC * piper_voice.config.sample_rate) * 2)
+        audio = b''.join(piper_voice.synthesize_ids_to_raw(piper_voice.phonemes_to_ids(phonemes)) + silence
+                         for phonemes in sentence_phonemes)
+
+        # The wav is written in one call, which also finalizes its header
+        with wave.open(output_file, 'wb') as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(piper_voice.config.sample_rate)
+            f.setnframes(len(audio) // 2)
+            f.writeframesraw(audio)
+
+        return len(audio) // 2 / piper_voice.config.sample_rate * 1000
+    else:
+        if not voice_model.piper_processes:
+            raise RuntimeError('The piper processes are stopped')
 
-    If wait is true the page will wait until the end of the speech.
+        # Piper prints the path of the wav file once it is written
+        piper_process = voice_model.idle_piper_processes.get()
+        try:
+            piper_process.stdin.write(json.dumps({'text': text, 'output_file': os.path.abspath(output_file)}) + '\n')
+            piper_process.stdin.flush()
+            if not piper_process.stdout.readline():
+                raise subprocess.CalledProcessError(piper_process.wait(), piper_process.args)
+        finally:
+            voice_model.idle_piper_processes.put(piper_process)
 
-    :param self: Playwright Page object
-    :param text: text to be voiced or key of translation
-    :param wait: Whether actions should stop for speech duration
-    :raises FileNotFoundError: If model or piper path does not exist
-    """
-    global last_voice_end_timestamp
+        return _get_audio_duration(output_file)
 
-    # Wait when last voice is speaking
-    self.wait_for_voice()
 
-    text = _get_translation(text)
+def _synthesize(config: VoiceConfig, voice_model: VoiceModel, text: str, job_file: str) -> tuple[str, float]:
+    """
+    Synthesizes the text or takes the voice from the cache. Runs in a worker thread of the tts executor.
+    :param config: voice settings
+    :param voice_model: loaded voice model
+    :param text: text to be voiced
+    :param job_file: path of the wav file to be written if the voice cache is disabled
+    :return: path of the synthesized wav file and its duration in ms
+    :raises CalledProcessError: If piper has exited
+    """
+    if not config.use_cache:
+        return job_file, _run_voice_engine(config, voice_model, text, job_file)
+
+    cache_file = _voice_cache_path(config, text)
+    if os.path.exists(cache_file):
+        # The modification time orders the entries for pruning the cache
+        os.utime(cache_file)
+        return cache_file, _get_audio_duration(cache_file)
+
+    # Synthesize next to the cache entry, so that it is moved in atomically.
+    # The pruner skips the unfinished file, because it only removes .wav files.
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    fd, output_file = tempfile.mkstemp(suffix='.wav.part', dir=os.path.dirname(cache_file))
+    os.close(fd)
+    try:
+        voice_duration_ms = _run_voice_engine(config, voice_model, text, output_file)
+        os.replace(output_file, cache_file)
+    finally:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+
+    return cache_file, voice_duration_ms
+
+
+def _prune_voice_cache(cache_dir: str, max_size_mb: int):
+    """
+    Removes the least recently used voices from the cache until it fits into the maximum size.
+    Voices which are still synthesized are skipped.
+    :param cache_dir: directory of the voice cache
+    :param max_size_mb: maximum size of the cache in MB
+    """
+    cache_entries = []
+    for dir_path, _, file_names in os.walk(cache_dir):
+        for file_name in file_names:
+            if file_name.endswith('.wav'):
+                try:
+                    stat = os.stat(os.path.join(dir_path, file_name))
+                except FileNotFoundError:
+                    # Removed by another run in the meantime
+                    continue
+                cache_entries.append((stat.st_mtime, stat.st_size, os.path.join(dir_path, file_name)))
+
+    cache_size = sum(size for _, size, _ in cache_entries)
+    for _, size, cache_file in sorted(cache_entries):
+        if cache_size <= max_size_mb * 1024 * 1024:
+            break
+        try:
+            os.remove(cache_file)
+        except FileNotFoundError:
+            pass
+        cache_size -= size
+
+
+def _split_sentences(text: str) -> list[str]:
+    """
+    Splits the text into its sentences
+    :param text: text to be voiced
+    :return: sentences of the text, none if the text is blank
+    """
+    return [sentence for sentence in re.split(r'(?<=[.!?])\s+', text.strip()) if sentence]
 
-    voice_start_timestamp = datetime.datetime.now().timestamp()
-    output_file = os.path.join(tmp_dir_path, f'{round(voice_start_timestamp)}.wav')
 
-    start_process_datetime = datetime.datetime.now()
-    if voice_engine == VoiceEngine.COQUI.value:
-        coqui_tts.tts_to_file(text=text, file_path=output_file)
-    else:
-        # Ensure model exists
-        if not os.path.exists(tts_model):
-            raise FileNotFoundError(f'Model path {tts_model} does not exist')
+def _collect_voice_texts(func) -> list[str]:
+    """
+    Collects the texts of all voice calls which are passed as string literal in the source code of the function
+    :param func: function which calls page.voice(..)
+    :return: distinct texts in order of their appearance
+    """
+    tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    calls = sorted(
+        (node for node in ast.walk(tree)
+         if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'voice'
+         and node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)),
+        key=lambda node: (node.lineno, node.col_offset)
+    )
+    return list(dict.fromkeys(node.args[0].value for node in calls))
 
-        # Ensure piper exists
-        if not os.path.exists(piper_path):
-            raise FileNotFoundError(f'Piper executable {piper_path} does not exist')
 
-        subprocess.run(
-            [piper_path, '--model', tts_model, '--output_file', output_file],
-            input=str.encode(text)
-        )
+class TutorialSession:
+    """
+    State of one tutorial recording. The pages of the recording reach it by the tutorial_session
+    of their browser context.
+    """
 
-    end_process_datetime = datetime.datetime.now()
-    processing_time = end_process_datetime - start_process_datetime
+    def __init__(self, config: VoiceConfig, voice_model: VoiceModel, tmp_dir: str, tts_executor: ThreadPoolExecutor):
+        """
+        :param config: voice settings
+        :param voice_model: loaded voice model, which may be shared with other sessions of the same voice settings
+        :param tmp_dir: directory of the recording and the voice files
+        :param tts_executor: synthesizes voices in the background while the browser keeps running
+        """
+        self.voice_config = config
+        self.voice_model = voice_model
+        self.tmp_dir = tmp_dir
+        self.tts_executor = tts_executor
+        # Used to recognize if a voice is currently active. All timestamps are taken from time.monotonic().
+        self.last_voice_end_timestamp = 0.0
+        # Guards pending_voices, voice_jobs and last_voice_end_timestamp
+        self.voice_lock = threading.Lock()
+        # Voices whose synthesis may still be running as (voice start timestamp, sentence futures) in call order
+        self.pending_voices: list[tuple[float, list[Future]]] = []
+        # Syntheses by sentence, so that every sentence is only synthesized once
+        self.voice_jobs: dict[str, Future] = {}
+        self.voice_job_counter = count()
+        # All voices of the recording as (voice start timestamp, sentence futures).
+        # Their files are written after recording.
+        self.recorded_voices: list[tuple[float, list[Future]]] = []
+
+    def submit_voice(self, text: str) -> list[Future]:
+        """
+        Submits the synthesis of each sentence of the text to the tts executor unless it has already been submitted
+        :param text: text to be voiced
+        :return: futures of the synthesized wav file paths and their durations in ms
+        """
+        futures = []
+        with self.voice_lock:
+            for sentence in _split_sentences(text):
+                if sentence not in self.voice_jobs:
+                    job_file = os.path.join(self.tmp_dir, 'voices', f'{next(self.voice_job_counter):06d}.wav')
+                    self.voice_jobs[sentence] = self.tts_executor.submit(_synthesize, self.voice_config,
+                                                                         self.voice_model, sentence, job_file)
+                futures.append(self.voice_jobs[sentence])
+
+        return futures
+
+    def resolve_pending_voices(self):
+        """
+        Waits until all pending voices are synthesized and updates the end time of the last voice.
+        Only the durations are needed here, the voice files are written by drain_voices.
+        """
+        with self.voice_lock:
+            while self.pending_voices:
+                voice_start_timestamp, futures = self.pending_voices.pop(0)
+                self.recorded_voices.append((voice_start_timestamp, futures))
+                voice_duration_ms = sum(future.result()[1] for future in futures)
+
+                # Store last voice end time
+                self.last_voice_end_timestamp = max(self.last_voice_end_timestamp,
+                                                    voice_start_timestamp + voice_duration_ms / 1000)
+
+    def cancel_unused_voices(self):
+        """
+        Cancels the prefetched voices which the tutorial did not use
+        """
+        with self.voice_lock:
+            for future in self.voice_jobs.values():
+                future.cancel()
+
+    def drain_voices(self) -> list[tuple[str, float]]:
+        """
+        Waits for all voices of the recording and writes their sentences to numbered files in the tmp directory.
+        This runs after the recording, so that writing the files does not hold up the browser.
+        :return: sentence files with their start timestamp
+        """
+        self.resolve_pending_voices()
+
+        voice_manifest = []
+        for i, (voice_start_timestamp, futures) in enumerate(self.recorded_voices):
+            # The sentences of a voice are played back to back
+            sentence_start_timestamp = voice_start_timestamp
+            for n, future in enumerate(futures):
+                voice_file, sentence_duration_ms = future.result()
+                output_file = os.path.join(self.tmp_dir, f'{i:06d}_{n:02d}.wav')
+                # A hard link shares the bytes of the cached voice. Removing the tmp directory only drops the link.
+                # Links only work if --tmp-dir is on the filesystem of the cache. The default tmp directory in
+                # /dev/shm is on another device than ~/.cache, so by default the voices are copied.
+                try:
+                    os.link(voice_file, output_file)
+                except OSError:
+                    shutil.copy(voice_file, output_file)
+                voice_manifest.append((output_file, sentence_start_timestamp))
+                sentence_start_timestamp += sentence_duration_ms / 1000
+
+        return voice_manifest
+
+    def premix_audio(self, start_timestamp: float) -> str | None:
+        """
+        Mixes all voices of the recording into one audio track
+        :param start_timestamp: monotonic start time of the recording
+        :return: path of the mixed wav file or None if there are no voices
+        """
+        voice_manifest = self.drain_voices()
+        if not voice_manifest:
+            return None
+
+        voice_starts = [(voice_file, voice_start_timestamp - start_timestamp)
+                        for voice_file, voice_start_timestamp in voice_manifest]
+        audio_file = os.path.join(self.tmp_dir, 'mix.wav')
+        _mix_voices(voice_starts, audio_file)
+        return audio_file
+
+    def voice(self, page: Page, text: str, wait=True):
+        """
+        Generates voice that will be played in the video at the time of the call.
+        If a voice is active when this function is called, the new voice will be added after its end.
+        The voice is synthesized in the background, so its synthesis overlaps with the active voice and
+        with the following browser actions. Voices of the tutorial are usually synthesized before it starts.
+
+        If wait is true the page will wait until the end of the speech.
+
+        :param page: Playwright Page object
+        :param text: text to be voiced or key of translation
+        :param wait: Whether actions should stop for speech duration
+        """
+        futures = self.submit_voice(_get_translation(text))
+        # A blank text has nothing to say
+        if not futures:
+            return
+
+        # Wait when last voice is speaking
+        self.wait_for_voice(page)
+
+        voice_start_timestamp = time.monotonic()
+        with self.voice_lock:
+            self.pending_voices.append((voice_start_timestamp, futures))
+
+        # Wait until the synthesis is done and the speech has ended
+        if wait:
+            self.wait_for_voice(page)
+
+    def wait_for_voice(self, page: Page):
+        """
+        Waits when the last voice is speaking until its end time.
+        Voices which are still synthesized are finished first.
+        :param page: Playwright Page object
+        """
+        self.resolve_pending_voices()
+
+        last_voice_remaining_duration_sec = self.last_voice_end_timestamp - time.monotonic()
+        if last_voice_remaining_duration_sec > 0.0:
+            page.wait_for_timeout(last_voice_remaining_duration_sec * 1000)
 
-    voice_duration_ms = _get_audio_duration(output_file)
-    # Store last voice end time
-    last_voice_end_timestamp = voice_start_timestamp + voice_duration_ms / 1000
 
-    # Add time out to page with the duration of the speech
-    wait_time = voice_duration_ms - processing_time.seconds * 1000
-    if wait and wait_time > 0.0:
-        self.wait_for_timeout(wait_time)
+def generate_voice(self, text: str, wait=True):
+    """
+    Generates voice that will be played in the video at the time of the call, see TutorialSession.voice
+    :param self: Playwright Page object
+    :param text: text to be voiced or key of translation
+    :param wait: Whether actions should stop for speech duration
+    """
+    self.context.tutorial_session.voice(self, text, wait)
 
 
 def wait_for_voice(self):
@@ -126,50 +484,212 @@ def wait_for_voice(self):
     Waits when the last voice is speaking until its end time
     :param self: Playwright Page object
     """
-    last_voice_remaining_duration_sec = last_voice_end_timestamp - datetime.datetime.now().timestamp()
-    if last_voice_remaining_duration_sec > 0.0:
-        self.wait_for_timeout(last_voice_remaining_duration_sec * 1000)
+    self.context.tutorial_session.wait_for_voice(self)
+
+
+def _mix_voices(voice_starts: list[tuple[str, float]], output_file: str):
+    """
+    Places mono 16 bit voices into one wav file at their start time.
+    Voices do not overlap, because a voice only starts after the previous one has ended.
+    :param voice_starts: paths of the voice wav files with their start time in seconds
+    :param output_file: path of the mixed wav file
+    """
+    import numpy as np
 
+    voices = []
+    for voice_file, start_time in voice_starts:
+        with wave.open(voice_file, 'rb') as f:
+            sample_rate = f.getframerate()
+            samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+        voices.append((max(0, round(start_time * sample_rate)), samples))
 
-def _make_video(start_datetime: datetime, output_file: str):
-    # Collect all voice files
-    voice_files = glob.glob(f'{tmp_dir_path}/*.wav')
+    mix = np.zeros(max(offset + len(samples) for offset, samples in voices), dtype=np.int16)
+    for offset, samples in voices:
+        mix[offset:offset + len(samples)] = samples
 
-    # Add all voices to video
-    video_file = glob.glob(f'{tmp_dir_path}/*.webm')[0]
-    video_clip = VideoFileClip(video_file)
+    with wave.open(output_file, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(mix.tobytes())
 
-    voice_clips = []
-    for voice_file in voice_files:
-        file_timestamp = int(Path(voice_file).stem)
-        start_time = file_timestamp - start_datetime.timestamp()
-        voice_clips.append(AudioFileClip(voice_file).set_start(start_time))
 
-    if voice_clips:
-        video_clip.audio = CompositeAudioClip(voice_clips)
+def _pick_video_encoder(ffmpeg: str) -> str:
+    """
+    Finds a hardware video encoder which works on this machine by encoding a test frame
+    :param ffmpeg: path of the ffmpeg executable
+    :return: name of the first working hardware encoder or libx264
+    """
+    for encoder, (input_args, output_args) in HARDWARE_VIDEO_ENCODERS.items():
+        # ffmpeg lists encoders which are compiled in, even if there is no device for them
+        test_command = [ffmpeg, '-loglevel', 'error', *input_args, '-f', 'lavfi', '-i', 'color=size=256x256',
+                        '-frames:v', '1', *output_args, '-f', 'null', '-']
+        try:
+            subprocess.run(test_command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=10,
+                           check=True)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            continue
+        return encoder
+
+    return 'libx264'
+
+
+def _make_video(video_file: str, audio_file: str | None, output_file: str, encoder_preset: str = 'ultrafast',
+                video_encoder: str = 'auto'):
+    """
+    Adds the audio track to the recorded video in a single ffmpeg pass.
+    A webm output file gets a copy of the recorded video stream. Other output files are encoded with H.264.
+    :param video_file: path of the webm recorded by playwright
+    :param audio_file: path of the mixed voices or None if there are no voices
+    :param output_file: path of the created video
+    :param encoder_preset: libx264 preset
+    :param video_encoder: H.264 encoder. auto selects a hardware encoder if one is available.
+    """
+    from imageio_ffmpeg import get_ffmpeg_exe
+
+    ffmpeg = get_ffmpeg_exe()
+    # Playwright records VP8, which only a webm container can hold without encoding
+    copy_video = output_file.endswith('.webm')
+    if not copy_video and video_encoder == 'auto':
+        video_encoder = _pick_video_encoder(ffmpeg)
+
+    command = [ffmpeg, '-y', '-loglevel', 'error']
+    if video_encoder in HARDWARE_VIDEO_ENCODERS and not copy_video:
+        command += HARDWARE_VIDEO_ENCODERS[video_encoder][0]
+    command += ['-i', video_file]
+    if audio_file:
+        command += ['-i', audio_file, '-map', '0:v', '-map', '1:a']
+
+    if copy_video:
+        command += ['-c:v', 'copy', '-c:a', 'libopus']
+    else:
+        if video_encoder in HARDWARE_VIDEO_ENCODERS:
+            command += HARDWARE_VIDEO_ENCODERS[video_encoder][1]
+        else:
+            # Screen recordings have little motion, so fast presets barely lose quality
+            command += ['-c:v', 'libx264', '-preset', encoder_preset, '-tune', 'stillimage', '-crf', '23',
+                        '-threads', '0', '-pix_fmt', 'yuv420p']
+        command += ['-c:a', 'aac', '-b:a', '128k']
 
     # Save created video
-    video_clip.write_videofile(output_file, codec="libx264", audio_codec="aac")
+    subprocess.run(command + [output_file], check=True)
 
 
-def init_voice(model: str):
+def init_voice(config: VoiceConfig, device: str = 'auto', tts_workers: int = 1) -> VoiceModel:
     """
     Initialization of the voice models
-    :param model: tts model
+    :param config: voice settings with the tts model
+    :param device: device of the coqui model. auto selects cuda if it is available.
+    :param tts_workers: number of voices which are synthesized in parallel
+    :return: loaded voice model
+    :raises FileNotFoundError: If model or piper path does not exist
     """
-    global voice_engine, coqui_tts
+    voice_model = VoiceModel()
+
+    if config.engine == VoiceEngine.COQUI.value:
+        import torch
+        from TTS.api import TTS
 
-    if voice_engine == VoiceEngine.COQUI.value:
         # German models:
         # tts_models/de/thorsten/tacotron2-DCA (bad quality)
-        # tts_models/de/thorsten/vits (good quality)
+        # tts_models/de/thorsten/vits (good quality, fastest)
         # tts_models/de/thorsten/tacotron2-DDC (best quality)
-        coqui_tts = TTS(model)
+        if device == 'auto':
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        voice_model.coqui_device = device
+        voice_model.coqui_tts = TTS(config.model).to(device)
+        # On cuda the model runs in half precision instead
+        if config.quantize and device == 'cpu':
+            voice_model.coqui_tts.synthesizer.tts_model = torch.ao.quantization.quantize_dynamic(
+                voice_model.coqui_tts.synthesizer.tts_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        return voice_model
+    else:
+        # Ensure model exists
+        if not os.path.exists(config.model):
+            raise FileNotFoundError(f'Model path {config.model} does not exist')
+
+        if not config.piper_subprocess:
+            try:
+                import onnxruntime
+                from piper import PiperVoice
+                from piper.config import PiperConfig
+            except ImportError:
+                PiperVoice = None
+
+            # Other versions than piper-tts 1.2 lack its synthesis api, so the executable is used instead
+            if PiperVoice is not None and not hasattr(PiperVoice, 'synthesize_ids_to_raw'):
+                warnings.warn('The installed piper-tts package is not version 1.2, '
+                              'the piper executable is used instead')
+                PiperVoice = None
+
+            if PiperVoice is not None:
+                with open(f'{config.model}.json', encoding='utf-8') as f:
+                    model_config = PiperConfig.from_dict(json.load(f))
+
+                options = onnxruntime.SessionOptions()
+                # The tts workers share the single session and its intra-op pool, so the pool keeps all cores
+                options.intra_op_num_threads = os.cpu_count()
+                options.inter_op_num_threads = 1
+                options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+                session = onnxruntime.InferenceSession(config.model, sess_options=options,
+                                                       providers=['CPUExecutionProvider'])
+                voice_model.piper_voice = PiperVoice(session=session, config=model_config)
+                return voice_model
+
+        # Ensure piper exists
+        if not os.path.exists(config.piper_path):
+            raise FileNotFoundError(f'Piper executable {config.piper_path} does not exist')
+
+        # Each input line is a json object with the text and the output file
+        for _ in range(tts_workers):
+            piper_process = subprocess.Popen(
+                [config.piper_path, '--model', config.model, '--json-input', '--output_dir', tempfile.gettempdir()],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+            )
+            voice_model.piper_processes.append(piper_process)
+            voice_model.idle_piper_processes.put(piper_process)
+
+    return voice_model
+
+
+def warm_up_voice(config: VoiceConfig, voice_model: VoiceModel):
+    """
+    Synthesizes a short text and discards it, so that the first voice of the tutorial
+    does not pay for loading the model graph and compiling kernels
+    :param config: voice settings
+    :param voice_model: loaded voice model
+    """
+    fd, output_file = tempfile.mkstemp(suffix='.wav')
+    os.close(fd)
+    try:
+        _run_voice_engine(config, voice_model, 'Hallo.', output_file)
+    except Exception:
+        # Errors are reported by the voices of the tutorial
+        pass
+    finally:
+        os.remove(output_file)
+
+
+def close_voice(voice_model: VoiceModel):
+    """
+    Stops the piper processes of the voice model after all its voices are synthesized.
+    Closing a voice model again does nothing.
+    :param voice_model: loaded voice model
+    """
+    piper_processes = voice_model.piper_processes
+    voice_model.piper_processes = []
+    voice_model.idle_piper_processes = queue.SimpleQueue()
+    for piper_process in piper_processes:
+        piper_process.stdin.close()
+    for piper_process in piper_processes:
+        piper_process.wait()
 
 
 def init_translations(translation_file: str):
     """
-    Reads the passed translation file
+    Reads the passed translation file. The parsed translations are pickled into the cache directory
+    and reused as long as the file is unchanged.
     :param translation_file: translation file
     """
     if not translation_file:
@@ -180,8 +700,63 @@ def init_translations(translation_file: str):
     if not os.path.exists(translation_file):
         raise FileNotFoundError(f'Translation file {translation_file} does not exist')
 
-    with open(translation_file) as f:
-        translations = json.load(f)
+    # The pickle is addressed by the path, size and modification time of the file, so that a changed file is parsed again
+    stat = os.stat(translation_file)
+    file_key = f'{os.path.abspath(translation_file)}|{stat.st_size}|{stat.st_mtime_ns}'
+    pickle_dir = os.path.join(DEFAULT_VOICE_CACHE_DIR, 'translations')
+    pickle_file = os.path.join(pickle_dir, f'{hashlib.sha256(file_key.encode()).hexdigest()}.pkl')
+    if os.path.exists(pickle_file):
+        with open(pickle_file, 'rb') as f:
+            loaded_translations = pickle.load(f)
+    else:
+        if orjson is not None:
+            with open(translation_file, 'rb') as f:
+                loaded_translations = orjson.loads(f.read())
+        else:
+            with open(translation_file) as f:
+                loaded_translations = json.load(f)
+
+        # The pickle is only an optimization, so a read-only cache directory is fine
+        try:
+            os.makedirs(pickle_dir, exist_ok=True)
+            fd, output_file = tempfile.mkstemp(suffix='.pkl', dir=pickle_dir)
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(loaded_translations, f)
+            os.replace(output_file, pickle_file)
+        except OSError:
+            pass
+
+    # Translations are only read after initialization
+    translations = MappingProxyType(loaded_translations)
+
+
+def _parse_positive_int(value: str) -> int:
+    """
+    Parses an argument which has to be a positive integer
+    :param value: argument value
+    :return: parsed integer
+    :raises ArgumentTypeError: If the value is no positive integer
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'{value} is no positive integer')
+    return number
+
+
+def _parse_resolution(value: str) -> dict[str, int]:
+    """
+    Parses a resolution argument
+    :param value: resolution as WIDTHxHEIGHT
+    :return: resolution as playwright size
+    :raises ArgumentTypeError: If the value is no resolution
+    """
+    match = re.fullmatch(r'(\d+)x(\d+)', value.strip().lower())
+    if not match:
+        raise argparse.ArgumentTypeError(f'{value} is no resolution like 1280x720')
+    return {'width': int(match[1]), 'height': int(match[2])}
 
 
 def init_argparse():
@@ -196,18 +771,58 @@ def init_argparse():
                         help='The selected text-to-speech system.')
     parser.add_argument('-p', '--piper', type=str, dest='piper', default='./piper/piper',
                         help='The path to the piper executable. Default: ./piper/piper')
+    parser.add_argument('--piper-subprocess', action='store_true', dest='piperSubprocess',
+                        help='Runs the piper executable even if the piper-tts python package is installed.')
     parser.add_argument('-m', '--model', type=str, dest='model', required=True,
-                        help='The path or name of the language model. Example: tts_models/de/thorsten/tacotron2-DDC')
-    parser.add_argument('-o', '--output', type=str, dest='outputFile', default='tutorial.mp4',
-                        help='The path to the output file. Default: tutorial.mp4')
+                        help='The path or name of the language model. Example: tts_models/de/thorsten/vits')
+    parser.add_argument('-d', '--device', type=str, dest='device', choices=['auto', 'cpu', 'cuda'], default='auto',
+                        help='The device of the coqui model. auto uses cuda if it is available. '
+                             'On cuda the model runs in half precision. Default: auto')
+    parser.add_argument('-q', '--quantize', action='store_true', dest='quantize',
+                        help='Quantizes the linear layers of the coqui model to int8 when it runs on the cpu. '
+                             'This is about twice as fast, but may slightly lower the voice quality.')
+    parser.add_argument('-o', '--output', type=str, dest='outputFile', default='tutorial.webm',
+                        help='The path to the output file. A .webm file copies the recorded video '
+                             'instead of encoding it, other files such as .mp4 are encoded with H.264. '
+                             'Default: tutorial.webm')
+    parser.add_argument('-e', '--encoder-preset', type=str, dest='encoderPreset',
+                        choices=['ultrafast', 'superfast', 'veryfast', 'medium'], default='ultrafast',
+                        help='The libx264 preset of the output video. Slower presets create smaller files. '
+                             'Default: ultrafast')
+    parser.add_argument('-r', '--resolution', type=_parse_resolution, dest='resolution', default='1280x720',
+                        help='The size of the browser viewport and the recorded video as WIDTHxHEIGHT. '
+                             'Higher resolutions take longer to record and encode. Default: 1280x720')
+    parser.add_argument('--record-resolution', type=_parse_resolution, dest='recordResolution',
+                        help='The size of the recorded video as WIDTHxHEIGHT if it differs from the viewport. '
+                             'A smaller recording is encoded faster, but chromium has to scale each frame. '
+                             'Default: the --resolution')
+    parser.add_argument('--video-encoder', type=str, dest='videoEncoder',
+                        choices=['auto', 'libx264', *HARDWARE_VIDEO_ENCODERS], default='auto',
+                        help='The H.264 encoder of the output video. auto uses the first hardware encoder '
+                             'which works on this machine and falls back to libx264. Default: auto')
     parser.add_argument('-t', '--translation-file', type=str, dest='translationPath',
                         help='The path to a file with translations for voice. If a file is configured, '
                              'the default language texts will be replaced by their translations.')
-    parser.add_argument('--tmp-dir', type=str, dest='tmpDir', default='./tmp',
-                        help='The path to the temporary directory. Default: ./tmp')
-    parser.add_argument('-s', '--slowmo', type=int, dest='slowmo', default=1000,
+    parser.add_argument('--tmp-dir', type=str, dest='tmpDir',
+                        help='The path to the temporary directory. Default: a directory in the memory backed '
+                             '/dev/shm on Linux, otherwise a new directory in the system temporary directory')
+    parser.add_argument('-s', '--slowmo', type=int, dest='slowmo', default=100,
                         help='Sets slow motion time in milliseconds between execution of actions. '
-                             'Default: 1000.')
+                             'The voices pace the tutorial, so a short time is usually enough. Default: 100.')
+    parser.add_argument('--headless', action='store_true', dest='headless',
+                        help='Runs the browser without a window. The video is recorded nevertheless and '
+                             'the browser needs less CPU.')
+    parser.add_argument('--browser-arg', type=str, dest='browserArgs', action='append', default=[],
+                        help='An additional command line argument of chromium, e.g. --browser-arg=--use-gl=angle. '
+                             'Can be passed several times.')
+    parser.add_argument('-w', '--tts-workers', type=_parse_positive_int, dest='ttsWorkers', default=3,
+                        help='The number of voices which can be synthesized in parallel. The piper executable '
+                             'is started once per worker. Default: 3')
+    parser.add_argument('--no-voice-cache', action='store_true', dest='noVoiceCache',
+                        help=f'Synthesizes all voices again instead of reusing them from {DEFAULT_VOICE_CACHE_DIR}.')
+    parser.add_argument('--voice-cache-size', type=int, dest='voiceCacheSize', default=1024,
+                        help='The maximum size of the voice cache in MB. The least recently used voices are removed '
+                             'after the recording. Default: 1024')
     return parser
 
 
@@ -215,7 +830,7 @@ def mark_element(self: Locator, timeout: float=3000):
     """
     Highlight element with a red border. The border is set by inline css.
     :param self: Locator identifying the element to highlight
-    :param timeout: timeout after highlight
+    :param timeout: maximum time in ms to wait until the element is visible
     :return: Locator
     """
     self.evaluate("element => element.style['border'] = '2px solid red'")
@@ -223,83 +838,53 @@ def mark_element(self: Locator, timeout: float=3000):
     return self
 
 
-def run(playwright: Playwright) -> None:
-    parser = init_argparse()
-    args = parser.parse_args()
-
-    global tmp_dir_path, voice_engine, piper_path, tts_model
-    voice_engine = args.engine
-    piper_path = args.piper
-    tts_model = args.model
-    output_file = args.outputFile
-    translation_file = args.translationPath
-    tmp_dir_path = args.tmpDir
-    slowmo = args.slowmo
-
-    init_voice(tts_model)
-    init_translations(translation_file)
-
-    if os.path.exists(tmp_dir_path):
-        shutil.rmtree(tmp_dir_path)
-
-    os.mkdir(tmp_dir_path)
-
-    browser = playwright.chromium.launch(
-        headless=False,
-        slow_mo=slowmo  # Slow down execution speed
-    )
-    context = browser.new_context(
-        record_video_dir=tmp_dir_path,
-        viewport={'width': 1920, 'height': 1080},
-        record_video_size={'width': 1920, 'height': 1080}
-    )
-
-    start_datetime = datetime.datetime.now()
-
-    # TODO: Move to subclass
-    Locator.mark = mark_element
-    Page.voice = generate_voice
-    Page.wait_for_voice = wait_for_voice
-
+def tutorial(page: Page):
+    """
+    The tutorial which is recorded
+    :param page: Playwright Page object
+    """
     # Replace example code below with your playwright code.
     # You can simply generate code with the playwright generator in the shell
     # with the command: `playwright codegen [url]`
     # ---------------------
-    page = context.new_page()
     page.goto("http://localhost/studip/")
     page.voice("Dieses Tutorial zeigt, wie LTI Tools in Stud IP global konfiguriert werden "
                "können und diese in Courseware eingebunden werden.")
 
     page.voice("Zuerst melden sie sich mit ihren Zugangsdaten als Root-Nutzer in ihr Stud IP ein.", wait=False)
     page.get_by_role("link", name="Login for registered users").click()
-    page.get_by_label("Username:").click()
-    page.get_by_label("Username:").fill("root@studip")
-    page.get_by_label("Username:").press("Tab")
+    username = page.get_by_label("Username:")
+    username.click()
+    username.fill("root@studip")
+    username.press("Tab")
     page.get_by_label("Password:").fill("testing123")
     page.get_by_role("button", name="Login").click()
 
-    page.get_by_title("Zu Ihrer Administrationsseite").mark()
+    admin_page = page.get_by_title("Zu Ihrer Administrationsseite").mark()
     page.voice("Öffnen Sie anschließend die Administrationsseite")
-    page.get_by_title("Zu Ihrer Administrationsseite").click()
-    page.get_by_role("link", name="System").mark()
+    admin_page.click()
+    system_tab = page.get_by_role("link", name="System").mark()
     page.voice("Wählen sie hier den Reiter System")
-    page.get_by_role("link", name="System").click()
-    page.get_by_role("link", name="LTI-Tools").mark()
+    system_tab.click()
+    lti_tools = page.get_by_role("link", name="LTI-Tools").mark()
     page.voice("Klicken Sie links in der Navigation auf LTI-Tools")
-    page.get_by_role("link", name="LTI-Tools").click()
-    page.get_by_role("link", name="Neues LTI-Tool registrieren").mark(timeout=0)
+    lti_tools.click()
+    register_lti_tool = page.get_by_role("link", name="Neues LTI-Tool registrieren").mark(timeout=0)
     page.voice("Um ein neues LTI-Tool zu erstellen, wählen sie die Aktion 'Neues LTI Tool registrieren'")
-    page.get_by_role("link", name="Neues LTI-Tool registrieren").click()
+    register_lti_tool.click()
     page.voice("In diesem Dialog-Fenster können Sie alle relevanten Einstellungen ihres LTI Tools vornehmen."
                " Dazu zählen unter anderem der Name des Tools, seine URL und seine Schlüssel."
                " Als Beispiel wird ein JupyterHub-Tool konfiguriert.")
     page.get_by_label("Name der Anwendung").fill("JupyterHub")
-    page.get_by_label("URL der Anwendung").click()
-    page.get_by_label("URL der Anwendung").fill("https://jupyter.virtuos.uos.de/hub/lti/launch")
-    page.get_by_label("Consumer-Key").click()
-    page.get_by_label("Consumer-Key").fill("key")
-    page.get_by_label("Consumer-Secret").click()
-    page.get_by_label("Consumer-Secret").fill("secret")
+    tool_url = page.get_by_label("URL der Anwendung")
+    tool_url.click()
+    tool_url.fill("https://jupyter.virtuos.uos.de/hub/lti/launch")
+    consumer_key = page.get_by_label("Consumer-Key")
+    consumer_key.click()
+    consumer_key.fill("key")
+    consumer_secret = page.get_by_label("Consumer-Secret")
+    consumer_secret.click()
+    consumer_secret.fill("secret")
     page.get_by_label("Eingabe einer abweichenden URL im Kurs erlauben").check()
     page.get_by_label("Zusätzliche LTI-Parameter").click()
     page.voice("Abschließend speichern sie das Tool mit der Schaltfläche.")
@@ -307,30 +892,40 @@ def run(playwright: Playwright) -> None:
 
     page.voice("Das Tool ist nun konfiguriert und kann in Courseware genutzt werden. "
                "Als Beispiel öffnen Sie die Courseware in ihrem Arbeitsbereich.")
-    page.get_by_role("link", name="Arbeitsplatz").mark().click()
+    workplace = page.get_by_role("link", name="Arbeitsplatz").mark()
+    # mark() only waits until the element is visible, so the highlight is shown explicitly before the click
+    page.wait_for_timeout(1000)
+    workplace.click()
     page.voice("Erstellen Sie exemplarisch ein neues Lehrmaterial und öffnen sie dieses.", wait=False)
     page.get_by_role("link", name="Courseware Erstellen und Sammeln von Lernmaterialien").click()
     page.get_by_role("button", name="Lernmaterial hinzufügen").click()
-    page.get_by_label("Titel des Lernmaterials*").click()
-    page.get_by_label("Titel des Lernmaterials*").fill("JupyterHub-Test")
-    page.get_by_label("Beschreibung*").click()
-    page.get_by_label("Beschreibung*").fill("Ich bin eine JupyterHub-Test Courseware")
+    courseware_title = page.get_by_label("Titel des Lernmaterials*")
+    courseware_title.click()
+    courseware_title.fill("JupyterHub-Test")
+    courseware_description = page.get_by_label("Beschreibung*")
+    courseware_description.click()
+    courseware_description.fill("Ich bin eine JupyterHub-Test Courseware")
     page.get_by_role("button", name="Erstellen").click()
     page.get_by_role("link", name="JupyterHub-Test Ich bin eine JupyterHub-Test Courseware").click()
 
     page.voice("Legen sie nun den ersten Inhalt mit der entsprechenden Schaltfläche an.")
-    page.get_by_role("button", name="Ersten Inhalt erstellen").mark().click()
-    page.get_by_role("button", name="Block zu diesem Abschnitt hinzufügen").mark()
+    first_content = page.get_by_role("button", name="Ersten Inhalt erstellen").mark()
+    page.wait_for_timeout(1000)
+    first_content.click()
+    add_block = page.get_by_role("button", name="Block zu diesem Abschnitt hinzufügen").mark()
     page.voice("Als nächstes fügen wir den LTI-Block hinzu. Dazu klicken Sie auf die Schaltfläche 'Block zu diesem Abschnitt hinzufügen'")
-    page.get_by_role("button", name="Block zu diesem Abschnitt hinzufügen").click()
+    add_block.click()
     page.voice("Suchen sie nach dem LTI-Block und wählen diesen aus.")
     page.get_by_role("tabpanel", name="Blöcke").get_by_role("textbox").fill("lti")
-    page.get_by_role("link", name="LTI Einbinden eines externen Tools.").mark().click()
+    lti_block = page.get_by_role("link", name="LTI Einbinden eines externen Tools.").mark()
+    page.wait_for_timeout(1000)
+    lti_block.click()
     page.get_by_role("button", name="schließen").click()
     page.voice("Sie sehen jetzt die Bearbeitenansicht des Blocks. Auf dieser können sie den Namen des Blocks eingeben und"
                " das LTI-Tool auswählen.")
-    page.get_by_label("Titel").click()
-    page.get_by_label("Titel").fill("JupyterHub")
+    block_title = page.get_by_label("Titel")
+    block_title.click()
+    block_title.fill("JupyterHub")
     page.voice("Nachdem sie den Block fertig konfiguriert haben, können sie diesen mit der Schaltfläche abspeichern.")
     page.locator("section").filter(
         has_text="Bearbeiten Grunddaten Zusätzliche Einstellungen Titel Auswahl des externen Tools").get_by_role(
@@ -348,17 +943,111 @@ def run(playwright: Playwright) -> None:
     page.get_by_role("button", name="Aktionsmenü für JupyterHub-Test").click()
     page.get_by_role("link", name="Löschen").click()
     page.get_by_role("button", name="Ja").click()
+    # Show the result before the recording ends
+    page.wait_for_timeout(2000)
     # ---------------------
 
-    # end_datetime = datetime.datetime.now()
 
-    context.close()
-    browser.close()
+def run(playwright: Playwright, args: argparse.Namespace) -> None:
+    from playwright.sync_api import Page, Locator
+
+    voice_config = VoiceConfig(
+        engine=args.engine,
+        model=args.model,
+        piper_path=args.piper,
+        piper_subprocess=args.piperSubprocess,
+        quantize=args.quantize,
+        use_cache=not args.noVoiceCache
+    )
+    output_file = args.outputFile
+    translation_file = args.translationPath
+    # Keep the recording and the voices in memory if possible
+    if args.tmpDir:
+        tmp_dir_path = args.tmpDir
+        # Start with an empty directory. The directories below are new and private already.
+        if os.path.exists(tmp_dir_path):
+            shutil.rmtree(tmp_dir_path)
+        os.mkdir(tmp_dir_path)
+    elif sys.platform == 'linux' and os.path.isdir('/dev/shm'):
+        tmp_dir_path = tempfile.mkdtemp(prefix='tutorial-generator-', dir='/dev/shm')
+    else:
+        tmp_dir_path = tempfile.mkdtemp(prefix='tutorial-generator-')
+    slowmo = args.slowmo
+    tts_executor = ThreadPoolExecutor(max_workers=args.ttsWorkers)
+    voice_model = None
+    session = None
+
+    try:
+        # The piper processes are started inside, so that they are stopped on every failure
+        voice_model = init_voice(voice_config, args.device, args.ttsWorkers)
+        session = TutorialSession(voice_config, voice_model, tmp_dir_path, tts_executor)
+
+        # Warm up the model in the background while the browser starts
+        tts_executor.submit(warm_up_voice, voice_config, voice_model)
+        init_translations(translation_file)
+
+        os.mkdir(os.path.join(tmp_dir_path, 'voices'))
+
+        # Synthesize the voices of the tutorial ahead while the browser is started
+        for text in _collect_voice_texts(tutorial):
+            session.submit_voice(_get_translation(text))
+
+        browser = playwright.chromium.launch(
+            headless=args.headless,
+            args=args.browserArgs,
+            slow_mo=slowmo  # Slow down execution speed
+        )
+        context = browser.new_context(
+            record_video_dir=tmp_dir_path,
+            viewport=args.resolution,
+            record_video_size=args.recordResolution or args.resolution
+        )
+        # Popups and other pages of the context voice into the same recording
+        context.tutorial_session = session
+
+        start_timestamp = time.monotonic()
+
+        # TODO: Move to subclass
+        Locator.mark = mark_element
+        Page.voice = generate_voice
+        Page.wait_for_voice = wait_for_voice
+
+        page = context.new_page()
+        tutorial(page)
+
+        # Voices started without waiting may still be synthesized
+        session.resolve_pending_voices()
+        session.cancel_unused_voices()
+
+        # Mix the voices while playwright saves the recording
+        mix_future = tts_executor.submit(session.premix_audio, start_timestamp)
+        context.close()
+        # The recording is complete once the context is closed
+        video_file = page.video.path()
+        browser.close()
+
+        audio_file = mix_future.result()
+        tts_executor.shutdown()
+        close_voice(voice_model)
+
+        _make_video(video_file, audio_file, output_file, args.encoderPreset, args.videoEncoder)
+    finally:
+        # Voices which are still queued would otherwise be synthesized before the process can exit
+        if session is not None:
+            session.cancel_unused_voices()
+        tts_executor.shutdown(cancel_futures=True)
+        if voice_model is not None:
+            close_voice(voice_model)
+        shutil.rmtree(tmp_dir_path, ignore_errors=True)
+
+    if voice_config.use_cache:
+        _prune_voice_cache(voice_config.cache_dir, args.voiceCacheSize)
 
-    _make_video(start_datetime, output_file)
 
-    shutil.rmtree(tmp_dir_path)
+if __name__ == '__main__':
+    arguments = init_argparse().parse_args()
 
+    from playwright.sync_api import sync_playwright
 
-with sync_playwright() as playwright:
-    run(playwright)
+    with sync_playwright() as playwright:
+        run(playwright, arguments)